@@ -5,15 +5,15 @@ from OpenStreetMap. Here's a summary of its main components and functionality:
 1. Setup and Initialization:
    - Imports necessary libraries (Selenium, Pillow, etc.)
    - Defines functions for setting up the browser (use Chrome, not Firefox)
-   - Creates directories for storing raw and processed images
+   - Creates directories for storing processed images
 
 2. Image Capture:
    - Opens OpenStreetMap in a browser at a specified zoom level
-   - Navigates the map in a spiral pattern, taking screenshots at each position
-   - Saves raw screenshots and crops them to remove UI elements
+   - Navigates the map row by row in a snake pattern, taking screenshots at each position
+   - Keeps screenshots in memory and crops them to remove UI elements
 
 3. Image Processing:
-   - Crops raw screenshots to remove dark UI elements
+   - Crops screenshots to remove dark UI elements
    - Saves cropped images with position information in the filename
 
 4. Image Assembly:
@@ -23,7 +23,7 @@ from OpenStreetMap. Here's a summary of its main components and functionality:
    - Saves the final assembled map as a PNG file
 
 5. Utility Functions:
-   - Implements waiting mechanisms with visual feedback
+   - Waits for the map tiles to load after each move of the map
    - Provides cleanup functionality to remove temporary files and close the browser
 
 6. Main Execution:
@@ -36,13 +36,26 @@ It's particularly useful for capturing detailed maps of specific areas that migh
 as a single image from OpenStreetMap.
 """
 
+import base64
+import http.client
+import math
 import os
-import sys
+import re
+import shutil
 import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from io import BytesIO
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.chromium.webdriver import ChromiumDriver
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.support.ui import WebDriverWait
+import PIL
 from PIL import Image
+import numpy as np
+import png  # pypng, writes the assembled map row by row
 
 # - image zero point is the top-left corner of the image
 #   https://realpython.com/image-processing-with-the-python-pillow-library/
@@ -50,6 +63,23 @@ from PIL import Image
 #   to drag it right results in content on the left
 #   for up and down & down and up it's the very same
 
+# cropped images are named after their (x, y) position on the walk, e.g. screenshot_-2_1.bmp,
+# tiles fetched from the tile server after their position relative to the centre tile, e.g. tile_3_-1.bmp
+SCREENSHOT_POSITION_PATTERN = re.compile(r'(?:screenshot|tile)_(-?\d+)_(-?\d+)\.bmp$')
+
+# OpenStreetMap tile server, see https://operations.osmfoundation.org/policies/tiles/ for its usage policy:
+# a User-Agent identifying the application is required and at most 2 parallel downloads are allowed
+TILE_SERVER_URL = "https://tile.openstreetmap.org/{zoom}/{x}/{y}.png"
+TILE_USER_AGENT = "printable_map_creator/1.0 (+https://github.com/ikko/printable_map_creator)"
+TILE_DOWNLOADS = 2
+TILE_SIZE = 256
+
+# zlib level of the assembled PNG: level 1 encodes several times faster than the default 6,
+# the large single coloured areas of a map keep the file only slightly bigger
+PNG_COMPRESS_LEVEL = 1
+# the encoders hand over the compressed map in small chunks, a large buffer turns them into few writes
+OUTPUT_BUFFER_SIZE = 1 << 20
+
 
 def setup_browser():
     """
@@ -62,7 +92,12 @@ def setup_browser():
 
 def selenium_chromium():
     options = webdriver.ChromeOptions()
-    options.add_argument("--start-maximized")
+    # headless with a fixed window size: starts faster, pushes no frames to a screen,
+    # and every screenshot has the same size regardless of the display
+    options.add_argument("--headless=new")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--hide-scrollbars")
+    options.add_argument("--disable-gpu")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     driver = webdriver.Chrome(options=options)
@@ -71,7 +106,6 @@ def selenium_chromium():
 
 def selenium_firefox():
     options = webdriver.FirefoxOptions()
-    options.add_argument("--start-maximized")
     driver = webdriver.Firefox(options=options)
     driver.maximize_window()
     return driver
@@ -81,28 +115,25 @@ def create_directories(zoom_level, steps):
     """
     Create necessary directories for storing screenshots and outputs.
 
-    This function creates a base directory with a timestamp and two subdirectories
-    within it: one for raw screenshots and another for cropped images. The
-    directories are created with unique names based on the current timestamp to
-    avoid overwriting previous outputs.
+    This function creates a base directory with a timestamp and a subdirectory
+    within it for cropped images. Screenshots are kept in memory, so they need no
+    directory. The directories are created with unique names based on the current
+    timestamp to avoid overwriting previous outputs.
 
     Returns:
-    tuple: A tuple containing three strings:
+    tuple: A tuple containing two strings:
         - base_dir (str): Path to the base directory for all outputs.
-        - raw_dir (str): Path to the directory for storing raw screenshots.
         - cropped_dir (str): Path to the directory for storing cropped images.
     """
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     base_dir = f"map_steps{steps}_zoom{zoom_level}_{timestamp}"
     os.makedirs(base_dir, exist_ok=True)
-    raw_dir = os.path.join(base_dir, "raw_screenshots")
     cropped_dir = os.path.join(base_dir, "cropped_images")
-    os.makedirs(raw_dir, exist_ok=True)
     os.makedirs(cropped_dir, exist_ok=True)
-    return base_dir, raw_dir, cropped_dir
+    return base_dir, cropped_dir
 
 
-def open_browser(zoom_level=17):
+def open_browser(zoom_level=17, latitude=47.496930, longitude=19.050561):
     """
     Initialize and open a browser with OpenStreetMap at a specified zoom level.
 
@@ -112,6 +143,8 @@ def open_browser(zoom_level=17):
     Parameters:
     zoom_level (int, optional): The zoom level for the map. Defaults to 17.
                                 Higher values zoom in closer, lower values zoom out.
+    latitude (float, optional): Latitude of the map center. Defaults to Budapest.
+    longitude (float, optional): Longitude of the map center. Defaults to Budapest.
 
     Returns:
     WebDriver: A Selenium WebDriver instance with the map loaded and ready for interaction.
@@ -123,47 +156,29 @@ def open_browser(zoom_level=17):
     driver = setup_browser()
 
     # Open the map
-    map_url = f"https://www.openstreetmap.org/relation/22259#map={zoom_level}/47.496930/19.050561"
+    map_url = f"https://www.openstreetmap.org/relation/22259#map={zoom_level}/{latitude:.6f}/{longitude:.6f}"
     print("Opening map in browser...")
     driver.get(map_url)
     print("Content loaded...")
     return driver
 
 
-def take_screenshot(driver, filename):
+def crop_image_from_bytes(png_bytes, cropped_dir, filename, dark):
     """
-    Take a screenshot of the current browser window and save it to a file.
+    Crop the darker UI elements from an in-memory screenshot and save the result.
 
-    This function uses the Selenium WebDriver to capture a screenshot of the
-    current state of the browser window and saves it to the specified file.
+    This function decodes the PNG bytes of a screenshot, crops it to remove dark UI
+    elements from the edges, and saves the cropped image to a specified directory.
+    The raw screenshot never touches the disk. The cropped image is only an intermediate
+    for the assembly, so it is saved as an uncompressed RGB BMP: writing and reading it back
+    skips the zlib work of a PNG, only the assembled map is compressed.
+    With all margins zero the decoded screenshot is saved as it is, without a crop.
 
     Parameters:
-    driver (selenium.webdriver.remote.webdriver.WebDriver): The Selenium WebDriver
-        instance controlling the browser.
-    filename (str): The path and name of the file where the screenshot will be saved.
-        The file extension should typically be '.png'.
-
-    Returns:
-    None
-
-    Side effects:
-    - Saves a screenshot file to the specified location.
-    - Prints a confirmation message to the console.
-    """
-    driver.save_screenshot(filename)
-    print(f"Saved screenshot: {filename}")
-
-
-def crop_image(filename, cropped_dir, dark):
-    """
-    Crop the darker UI elements from the screenshot and save the result.
-
-    This function opens an image file, crops it to remove dark UI elements
-    from the edges, and saves the cropped image to a specified directory.
-
-    Parameters:
-    filename (str): The path to the image file to be cropped.
+    png_bytes (bytes): The screenshot as PNG encoded bytes, as returned by
+        driver.get_screenshot_as_png().
     cropped_dir (str): The directory where the cropped image will be saved.
+    filename (str): The name of the cropped image file, e.g. 'screenshot_0_0.bmp'.
     dark (dict): A dictionary containing the pixel values for cropping.
                   Expected keys are 'left', 'top', 'right', and 'bottom',
                   representing the number of pixels to crop from each edge.
@@ -175,78 +190,110 @@ def crop_image(filename, cropped_dir, dark):
     The function prints a message with the saved filename and dimensions
     of the cropped image.
     """
-    with Image.open(filename) as img:
-        width, height = img.size
-        cropped_img = img.crop((dark["left"], dark["top"], width - dark["right"], height - dark["bottom"]))
-        cropped_filename = os.path.join(cropped_dir, os.path.basename(filename))
-        cropped_img.save(cropped_filename)
-        width, height = cropped_img.size
-        print(f"Cropped and saved image: {cropped_filename} area: {width}x{height}px")
+    cropped_filename = os.path.join(cropped_dir, filename)
+    with Image.open(BytesIO(png_bytes)) as img:
+        if not any(dark.values()):
+            # nothing to crop, e.g. a screenshot already clipped by the browser
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.save(cropped_filename, format='BMP')
+            width, height = img.size
+            print(f"Saved image without cropping: {cropped_filename} area: {width}x{height}px")
+            return width, height
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        pixels = np.asarray(img)
+    # the crop is a view into the decoded pixels, alpha is dropped by the same slice
+    height, width = pixels.shape[:2]
+    cropped_pixels = pixels[dark["top"]:height - dark["bottom"], dark["left"]:width - dark["right"], :3]
+    Image.fromarray(cropped_pixels).save(cropped_filename, format='BMP')
+    height, width = cropped_pixels.shape[:2]
+    print(f"Cropped and saved image: {cropped_filename} area: {width}x{height}px")
 
     return width, height
 
 
-def wait(seconds):
+def capture_screenshot(driver, dark, viewport_width, viewport_height):
     """
-    Pause execution for a specified number of seconds while displaying a visual progress indicator.
+    Take a screenshot of the map, clipped to the area inside the dark UI elements when possible.
 
-    This function prints a waiting message followed by a series of dots, one for each second of the wait time.
-    It provides a visual indication of the passage of time during the wait period.
+    Chromium based browsers are asked through the DevTools Protocol for a screenshot of the
+    clip only, so the browser never encodes the UI edges and the crop of the screenshot
+    becomes a no-op. Other browsers, like Firefox, have no DevTools Protocol and return the
+    whole window, which is cropped later.
 
     Parameters:
-    seconds (int): The number of seconds to wait.
+    driver (WebDriver): Selenium WebDriver instance controlling the browser.
+    dark (dict): Dictionary containing pixel values for cropping dark UI elements.
+    viewport_width (int): The width of the viewport in pixels.
+    viewport_height (int): The height of the viewport in pixels.
 
-    Side effects:
-    Prints a waiting message and a series of dots to the console, with one dot printed each second.
+    Returns:
+    tuple: The screenshot as PNG encoded bytes and the margins (dict) still to be
+           cropped from it, all zero if the browser has already clipped it.
     """
-    print(f"waiting {seconds} seconds.", end="", flush=True)
-    for _ in range(seconds):
-        print(".", end="", flush=True)
-        time.sleep(1)
-    print()
-
-
-def move_mouse_to_center_of_viewport(action, driver):
+    if isinstance(driver, ChromiumDriver):
+        clip = {
+            "x": dark["left"],
+            "y": dark["top"],
+            "width": viewport_width - dark["left"] - dark["right"],
+            "height": viewport_height - dark["top"] - dark["bottom"],
+            "scale": 1,
+        }
+        screenshot = driver.execute_cdp_cmd("Page.captureScreenshot", {"format": "png", "clip": clip})
+        return base64.b64decode(screenshot["data"]), dict(left=0, top=0, right=0, bottom=0)
+    return driver.get_screenshot_as_png(), dark
+
+
+def wait_for_map_tiles(driver, timeout_seconds):
     """
-    Move the mouse cursor to the center of the browser viewport.
+    Wait until the map in the browser has loaded all of its tiles, but at most timeout_seconds.
 
-    This function calculates the center coordinates of the viewport and moves
-    the mouse cursor to that position. It's typically used before performing
-    drag operations to ensure consistent starting positions.
+    OpenStreetMap draws the map with Leaflet, which marks every tile image with the
+    'leaflet-tile-loaded' class once it has arrived, then fades it in over about 200ms.
+    Polling the page every 50ms until every tile is loaded and fully opaque lets the walk go on
+    as soon as the map is complete, instead of always sleeping for the worst case, without
+    taking a screenshot of half transparent tiles. The short pause before the polling starts
+    counts towards timeout_seconds, so the wait never takes longer than that.
 
     Parameters:
-    action (ActionChains): The Selenium ActionChains object used for performing
-                           mouse actions.
     driver (WebDriver): The Selenium WebDriver instance controlling the browser.
+    timeout_seconds (int): The longest time to wait in total, the map is used as it is after that.
 
-    Returns:
-    tuple: A tuple containing four integers:
-        - center_x (int): The x-coordinate of the viewport's center.
-        - center_y (int): The y-coordinate of the viewport's center.
-        - viewport_height (int): The height of the viewport in pixels.
-        - viewport_width (int): The width of the viewport in pixels.
+    Side effects:
+    Prints how long the wait took, or that the map was still loading.
     """
-    viewport_height, viewport_width = retrieve_viewport_size(driver)
-    # Move mouse to the center of the viewport usually before dragging
-    center_x = viewport_width // 2
-    center_y = viewport_height // 2
-    move_mouse_to(action, center_x, center_y)
-    return center_x, center_y, viewport_height, viewport_width
+    start_time = time.time()
+    # give Leaflet a moment to finish the drag and request the new tiles, out of the same time budget
+    settle_seconds = min(0.5, timeout_seconds)
+    time.sleep(settle_seconds)
+    try:
+        WebDriverWait(driver, timeout_seconds - settle_seconds, poll_frequency=0.05).until(
+            lambda d: d.execute_script(
+                "return Array.from(document.querySelectorAll('img.leaflet-tile')).every("
+                "tile => tile.classList.contains('leaflet-tile-loaded') && getComputedStyle(tile).opacity === '1');"
+            )
+        )
+        print(f"map loaded in {time.time() - start_time:.2f} seconds.")
+    except TimeoutException:
+        print(f"map still loading after {timeout_seconds} seconds, going on.")
 
 
 def move_mouse_to(action, center_x, center_y):
     action.w3c_actions.pointer_action.move_to_location(center_x, center_y)
 
 
-def pan_with_mouse(action, center_x, center_y, dx, dy, movement_pixels, viewport_height, viewport_width, pan_wait_seconds, direction_text):
+def pan_with_mouse(driver, center_x, center_y, dx, dy, movement_pixels, viewport_height, viewport_width, pan_wait_seconds, direction_text, verbose=False):
     """
     Pan the map using mouse actions within the browser viewport.
 
     This function calculates the end position for a pan movement, performs the pan action
     using Selenium's ActionChains, and waits for the map to load after panning.
+    Moving to the center, pressing, dragging and releasing the mouse button are sent to the
+    browser as one W3C actions sequence with a single perform() call.
 
     Parameters:
-        action (ActionChains): Selenium ActionChains object for performing mouse actions.
+        driver (WebDriver): The Selenium WebDriver instance controlling the browser.
         center_x (int): X-coordinate of the center of the viewport.
         center_y (int): Y-coordinate of the center of the viewport.
         dx (int): Horizontal direction of movement (-1 for left, 1 for right, 0 for no horizontal movement).
@@ -254,13 +301,14 @@ def pan_with_mouse(action, center_x, center_y, dx, dy, movement_pixels, viewport
         movement_pixels (int): Number of pixels to move in the specified direction.
         viewport_height (int): Height of the browser viewport in pixels.
         viewport_width (int): Width of the browser viewport in pixels.
-        pan_wait_seconds (int): Number of seconds to wait after panning for the map to load.
+        pan_wait_seconds (int): Maximum number of seconds to wait after panning for the map to load.
         direction_text (str): Textual description of the panning direction for logging purposes.
+        verbose (bool, optional): Print debugging information about every pan. Defaults to False.
 
     Side effects:
-    - Prints debugging information about the panning action.
+    - Prints debugging information about the panning action if verbose.
     - Performs mouse actions in the browser to pan the map.
-    - Waits for a specified time after panning.
+    - Waits after panning until the map is loaded, at most pan_wait_seconds.
     """
     # Drag the map
     end_x = center_x + (dx * movement_pixels)
@@ -271,99 +319,182 @@ def pan_with_mouse(action, center_x, center_y, dx, dy, movement_pixels, viewport
     # Prepare where to go
     move_mouse_x = end_x - center_x
     move_mouse_y = end_y - center_y
-    print(f"Calculating next image ------------------------------------------------------------------------")
-    print(
-        f"For next vales for {direction_text} ({dx}, {dy}) direction mouse move x: {move_mouse_x}, y: {move_mouse_y}, end_x: {end_x}, end_y: {end_y}")
-    # Drag with mouse button held down
-    action.click_and_hold().perform()
-    action.move_by_offset(move_mouse_x, move_mouse_y).release().perform()
-    print(f"Patience while browser loads images, ", end="", flush=True)
-    wait(pan_wait_seconds)  # seconds, Wait for the map to load
+    if verbose:
+        print(f"Calculating next image ------------------------------------------------------------------------")
+        print(
+            f"For next vales for {direction_text} ({dx}, {dy}) direction mouse move x: {move_mouse_x}, y: {move_mouse_y}, end_x: {end_x}, end_y: {end_y}")
+    # Drag from the center with mouse button held down, a fresh chain per pan keeps no state between pans
+    action = ActionChains(driver)
+    move_mouse_to(action, center_x, center_y)
+    action.click_and_hold().move_by_offset(move_mouse_x, move_mouse_y).release().perform()
+    print(f"Patience while browser loads images, ", end="")
+    wait_for_map_tiles(driver, pan_wait_seconds)
 
 
 def retrieve_viewport_size(driver):
-    viewport_width = driver.execute_script("return window.innerWidth;")
-    viewport_height = driver.execute_script("return window.innerHeight;")
+    # both sizes in one round trip to the browser
+    viewport_width, viewport_height = driver.execute_script("return [window.innerWidth, window.innerHeight];")
     return viewport_height, viewport_width
 
 
-def fetch_map(cropped_dir, dark, driver, movement_pixels, raw_dir, steps, pan_wait_seconds):
+def fetch_map(cropped_dir, dark, driver, movement_pixels, steps, pan_wait_seconds, verbose=False):
     """
-    Capture screenshots of a map by navigating through it in a spiral pattern using mouse dragging.
+    Capture screenshots of a map by navigating through it row by row using mouse dragging.
 
     This function moves through the map, takes screenshots at each position, crops them,
-    and saves both raw and cropped versions. It uses Selenium WebDriver to control the browser.
+    and saves the cropped versions. It uses Selenium WebDriver to control the browser.
+    Screenshots stay in memory as PNG bytes and are cropped in a process pool, so cropping
+    overlaps with panning and waiting for the map.
+
+    The positions form a square of (steps + 1) x (steps + 1) screenshots around the map center.
+    The walk snakes through its rows, right along one row and left along the next, so every
+    position is reached with a single pan and none is visited twice.
 
     Parameters:
     cropped_dir (str): Directory path to save cropped screenshots.
     dark (dict): Dictionary containing pixel values for cropping dark UI elements.
     driver (WebDriver): Selenium WebDriver instance controlling the browser.
     movement_pixels (int): Number of pixels to move in each direction during navigation.
-    raw_dir (str): Directory path to save raw screenshots.
-    steps (int): Number of "circles" to walk around the map center.
-    scroll_wait_seconds (int, optional): Time to wait for the map to load after each scroll. Defaults to 6.
+    steps (int): Number of movements along each side of the square of positions.
+    pan_wait_seconds (int): The longest time to wait for the map to load after each pan.
+    verbose (bool, optional): Print debugging information about every pan. Defaults to False.
 
     Returns:
     tuple: Dimensions (width, height) of the last cropped image.
 
     The function performs the following steps:
     1. Initializes variables for navigation and viewport dimensions.
-    2. Iterates through the specified number of steps in a spiral pattern.
-    3. At each position, takes a screenshot, saves it, and crops it.
+    2. Moves to the corner of the square, then iterates through its rows in a snake pattern.
+    3. At each position, takes a screenshot (clipped by Chromium itself), crops it and saves the cropped image.
     4. Moves the map view using mouse drag actions.
-    5. Waits for the specified time after each move to allow the map to load.
+    5. Waits after each move until the map is loaded, at most pan_wait_seconds.
     """
     # loadtime for a dragged page in seconds to wait between map subparts' requests
     print(f"Walking through the map...")
     print("==========================")
-    action = ActionChains(driver)
-    seen_positions = set()
     directions = dict(up=(0, -1), right=(1, 0), down=(0, 1), left=(-1, 0))  # (dx, dy) directions:
     name_of_directions = {v: k for k, v in directions.items()}
     x, y = 0, 0
+    # the window does not resize while walking, so the viewport is measured only once
+    viewport_height, viewport_width = retrieve_viewport_size(driver)
+    # drags start at the center of the viewport
+    center_x = viewport_width // 2
+    center_y = viewport_height // 2
 
-    # to keep the center in the middle, we move in the opposite directions half the distance for almost every step a step
+    # to keep the center in the middle, we start at the corner of the square: half the distance down and left
+    # for every step, dragging both ways at once since the drag stays well inside the viewport
     for _ in range(steps):
-        dx, dy = directions['down']
-        center_x, center_y, viewport_height, viewport_width = move_mouse_to_center_of_viewport(action, driver)
-        direction_name = name_of_directions[(dx, dy)]
-        pan_with_mouse(action, center_x, center_y, dx, dy, movement_pixels // 2, viewport_height, viewport_width, pan_wait_seconds, direction_name)
-        dx, dy = directions['left']
-        direction_name = name_of_directions[(dx, dy)]
-        center_x, center_y, viewport_height, viewport_width = move_mouse_to_center_of_viewport(action, driver)
-        pan_with_mouse(action, center_x, center_y, dx, dy, movement_pixels // 2, viewport_height, viewport_width, pan_wait_seconds, direction_name)
-
-
-    all_steps = range(1, steps + 1)
-    for step in all_steps:
-        for dx, dy in directions.values():
-            for sub_step in range(step):
-                if (x, y) not in seen_positions:
-                    # save screenshot of the current position of the map
-                    print(f"In substep {sub_step} of step {steps + 1} of {all_steps} steps, taking screenshot for position ({x}, {y}) then cropping...")
-                    screenshot_filename = os.path.join(raw_dir, f"screenshot_{x}_{y}.png")
-                    take_screenshot(driver, screenshot_filename)
-                    cropped_image_size = crop_image(screenshot_filename, cropped_dir, dark)
+        dx, dy = directions['left'][0], directions['down'][1]
+        pan_with_mouse(driver, center_x, center_y, dx, dy, movement_pixels // 2, viewport_height, viewport_width, pan_wait_seconds, "down-left", verbose)
+
+    crop_futures = []
+    # leaving the block waits for the last crops, also when the walk fails halfway
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as crop_pool:
+        positions_per_row = steps + 1
+        for row in range(positions_per_row):
+            # snake through the rows: right along the even ones, left along the odd ones
+            dx, dy = directions['right'] if row % 2 == 0 else directions['left']
+            for column in range(positions_per_row):
+                # save screenshot of the current position of the map
+                print(f"In row {row + 1} of {positions_per_row}, taking screenshot for position ({x}, {y}) then cropping...")
+                png_bytes, margins = capture_screenshot(driver, dark, viewport_width, viewport_height)
+                # crop in a worker process while the browser pans to the next position
+                crop_futures.append(crop_pool.submit(crop_image_from_bytes, png_bytes, cropped_dir, f"screenshot_{x}_{y}.bmp", margins))
+
+                # Pan with mouse along the row, at its end up to the next row, after the last position not at all
+                if column < positions_per_row - 1:
+                    move_dx, move_dy = dx, dy
+                elif row < positions_per_row - 1:
+                    move_dx, move_dy = directions['up']
                 else:
-                    print(f"Skipping screenshot for position ({x}, {y}) as it has already been taken.")
+                    break
+                direction_name = name_of_directions[(move_dx, move_dy)]
+                pan_with_mouse(driver, center_x, center_y, move_dx, move_dy, movement_pixels, viewport_height, viewport_width, pan_wait_seconds, direction_name, verbose)
 
-                # Move mouse to the center of the viewport before dragging
-                center_x, center_y, viewport_height, viewport_width = move_mouse_to_center_of_viewport(action, driver)
+                # Set next iteration's coordinates
+                x += move_dx
+                y += move_dy
 
-                # Pan with mouse and update positions cache
-                direction_name = name_of_directions[(dx, dy)]
-                pan_with_mouse(action, center_x, center_y, dx, dy, movement_pixels, viewport_height, viewport_width, pan_wait_seconds, direction_name)
-                seen_positions.add((x, y))
+    # result() re-raises if any of the crops failed
+    cropped_image_size = [future.result() for future in crop_futures][-1]
+    return cropped_image_size
 
-                # Set next iteration's coordinates
-                x += dx
-                y += dy
 
+def download_tile(zoom_level, tile_x, tile_y, cropped_dir, filename):
+    """
+    Download one map tile from the OpenStreetMap tile server and save it for the assembly.
 
-    return cropped_image_size
+    Parameters:
+    zoom_level (int): The zoom level of the tile.
+    tile_x (int): The column of the tile in the tile grid of the zoom level.
+    tile_y (int): The row of the tile in the tile grid of the zoom level.
+    cropped_dir (str): The directory where the tile will be saved.
+    filename (str): The name of the tile file, e.g. 'tile_0_0.bmp'.
 
+    Returns:
+    bool: True if the tile was saved, False if the download failed.
+    """
+    url = TILE_SERVER_URL.format(zoom=zoom_level, x=tile_x, y=tile_y)
+    request = urllib.request.Request(url, headers={"User-Agent": TILE_USER_AGENT})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            png_bytes = response.read()
+        # a response that is not an image, e.g. a proxy's block page, fails here as an OSError too
+        with Image.open(BytesIO(png_bytes)) as tile:
+            tile.convert('RGB').save(os.path.join(cropped_dir, filename), format='BMP')
+    # a truncated body or a broken status line is an HTTPException, not an OSError
+    except (OSError, http.client.HTTPException) as e:
+        print(f"Failed to download tile {url} since {repr(e)}")
+        return False
+    print(f"Downloaded tile {url} as {filename}")
+    return True
+
+
+def fetch_tiles(cropped_dir, zoom_level, latitude, longitude, radius):
+    """
+    Download the map tiles around a center point straight from the OpenStreetMap tile server.
+
+    This is an alternative to walking the map in a browser: the browser only renders these
+    same 256x256 tiles, so fetching them directly skips the rendering, the screenshots, the
+    cropping and the wait after every pan. The center tile is found with the Web Mercator
+    formula, then a square of (2 * radius + 1) x (2 * radius + 1) tiles is downloaded with
+    at most TILE_DOWNLOADS parallel connections, as the tile usage policy asks.
+
+    The tiles are saved like the cropped screenshots, named after their position relative to
+    the center tile, where positive x is west and positive y is north just as on the walk.
+    So they are assembled with movement_pixels=TILE_SIZE and steps=radius.
 
-def assemble_big_map(base_dir, cropped_dir, movement_pixels, steps, zoom_level, cropped_image_size, title):
+    Parameters:
+    cropped_dir (str): Directory path to save the tiles.
+    zoom_level (int): The zoom level of the tiles, up to 19.
+    latitude (float): Latitude of the map center.
+    longitude (float): Longitude of the map center.
+    radius (int): Number of tiles to fetch in every direction around the center tile.
+
+    Returns:
+    tuple: Dimensions (width, height) of a tile.
+    """
+    print(f"Downloading tiles from the tile server...")
+    print("==========================")
+    tile_count = 2 ** zoom_level
+    center_tile_x = int((longitude + 180.0) / 360.0 * tile_count)
+    center_tile_y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * tile_count)
+    with ThreadPoolExecutor(max_workers=TILE_DOWNLOADS) as download_pool:
+        downloads = []
+        for row in range(-radius, radius + 1):
+            tile_y = center_tile_y + row
+            if not 0 <= tile_y < tile_count:
+                continue
+            for column in range(-radius, radius + 1):
+                tile_x = (center_tile_x + column) % tile_count
+                filename = f"tile_{-column}_{-row}.bmp"
+                downloads.append(download_pool.submit(download_tile, zoom_level, tile_x, tile_y, cropped_dir, filename))
+        downloaded = sum(download.result() for download in downloads)
+    print(f"Downloaded {downloaded} of {len(downloads)} tiles.")
+    return TILE_SIZE, TILE_SIZE
+
+
+def assemble_big_map(base_dir, cropped_dir, movement_pixels, steps, zoom_level, cropped_image_size, title, scale=1.0):
     """
     Assemble a large map from cropped images and save it to a file.
 
@@ -378,6 +509,8 @@ def assemble_big_map(base_dir, cropped_dir, movement_pixels, steps, zoom_level,
     zoom_level (int): The zoom level of the map used during capture.
     cropped_image_size (tuple): A tuple (width, height) representing the size of each cropped image.
     title (str): The title of the map, used in the output filename.
+    scale (float, optional): Factor to downscale the assembled map by, above 0 and at most 1.0.
+        Defaults to 1.0.
 
     Side effects:
     - Prints a status message to the console.
@@ -388,18 +521,22 @@ def assemble_big_map(base_dir, cropped_dir, movement_pixels, steps, zoom_level,
     now_text = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_base_filename = os.path.join(base_dir, f"map_{underscored_title}_{now_text}")
     assemble_image_details(
-        cropped_dir, output_base_filename, movement_pixels, cropped_image_size, zoom_level, steps
+        cropped_dir, output_base_filename, movement_pixels, cropped_image_size, zoom_level, steps, scale
     )
 
 
 def assemble_image_details(
-        cropped_dir, output_base_filename, movement_pixels, cropped_image_size, zoom_level, steps,
+        cropped_dir, output_base_filename, movement_pixels, cropped_image_size, zoom_level, steps, scale=1.0,
     ):
     """
-    Assemble cropped images into a single large image using Pillow's paste function.
+    Assemble cropped images into a single large image.
 
     This function collects cropped images from a specified directory, calculates their positions,
-    and assembles them into a single large image. The assembled image is then saved to a file.
+    and assembles them into a single large image. The assembled image is written strip by strip
+    with pypng, so only one strip of rows is held in memory.
+    With a scale below 1.0 every cropped image is downscaled before it is placed, so a map
+    meant to be printed smaller never exists at full resolution: halving the scale quarters
+    the memory and the bytes copied.
 
     Parameters:
     cropped_dir (str): The directory containing the cropped image files.
@@ -408,113 +545,192 @@ def assemble_image_details(
     cropped_image_size (tuple): A tuple (width, height) representing the size of each cropped image.
     zoom_level (int): The zoom level of the map used during capture.
     steps (int): The number of steps taken in each direction during image capture.
+    scale (float, optional): Factor to downscale the assembled map by, above 0 and at most 1.0.
+        Defaults to 1.0.
 
     Returns:
     None
 
+    Raises:
+    ValueError: If scale is not above 0 and at most 1.0.
+
     Side effects:
     - Prints progress information to the console.
     - Saves the assembled image to a file.
     - Prints the file size of the saved image.
     """
+    if not 0 < scale <= 1:
+        raise ValueError(f"scale must be above 0 and at most 1.0, got {scale}")
     images = []
     positions = []
 
     # Collect filenames and positions from the cropped directory
     print("Collect filenames and positions from the cropped directory")
-    cropped_files = sorted(os.listdir(cropped_dir))
+    # no need to sort the listing, the placements are ordered by their offsets below
+    with os.scandir(cropped_dir) as entries:
+        cropped_files = list(entries)
     print(f"Found {len(cropped_files)} images in the cropped directory.")
-    for filename in cropped_files:
-        if filename.endswith(".png"):
-            filepath = os.path.join(cropped_dir, filename)
-            try:
-                parts = filename.replace(".png", "").split("_")
-                x, y = int(parts[1]), int(parts[2])
-                position = (x, y)
-                images.append(filepath)
-                positions.append(position)
-            except ValueError:
-                print(f"Skipping invalid filename format during assembly: {filename}")
-                continue
+    for entry in cropped_files:
+        match = SCREENSHOT_POSITION_PATTERN.match(entry.name)
+        if not match:
+            print(f"Skipping invalid filename format during assembly: {entry.name}")
+            continue
+        images.append(entry.path)
+        positions.append((int(match[1]), int(match[2])))
 
     if not positions:
         print("No valid images found for assembly. Exiting.")
         return
 
-    # size of the big picture, needs still refinement
     width, height = cropped_image_size
-    assembled_image_size_x = width + (movement_pixels * steps * 2) + 6000
-    assembled_image_size_y = height + (movement_pixels * steps * 2) + 6000
-
-    # this will hold all the images
-    print(f"creating empty assembled image: {assembled_image_size_x}x{assembled_image_size_y} pixel png.")
-    assembled_image = Image.new('RGBA', (assembled_image_size_x, assembled_image_size_y))
-    print("assembly image size in memory in bytes: ", sys.getsizeof(assembled_image.tobytes()))
-
-    # the very middle point of the assembled image
-    center_x = assembled_image_size_x // 2
-    center_y = assembled_image_size_y // 2
-    x_offset = center_x
-    y_offset = center_y
-
-    # process cropped images
-    i = 0
-    for img, pos in zip(images, positions):
-        print("......................................")
-        print(f"assembly at pos {pos} with offset: x:{x_offset} y:{y_offset} on {img}")
-        image = Image.open(img)
-        width, height = image.size
-        x, y = int(pos[0]), int(pos[1])
-
-        #          center     coordinates             cropped's center     against 'spiral' path displacement
-        x_offset = center_x - (x * movement_pixels) - (width // 2)        # + ((steps // 4) * movement_pixels)
-        y_offset = center_y - (y * movement_pixels) - (height // 2)         # - ((steps // 4) * movement_pixels)
-        assembled_image.paste(image, (x_offset, y_offset))
-        print(f"Image position: ({x},{y}) size {width}x{height}px pasted into assembled map.")
+    # a very small scale still keeps every cropped image at least one pixel in size
+    width, height = max(1, round(width * scale)), max(1, round(height * scale))
+
+    # positions as one array per coordinate, so the offsets of all images are computed at once
+    xs = np.fromiter((pos[0] for pos in positions), dtype=np.int32, count=len(positions))
+    ys = np.fromiter((pos[1] for pos in positions), dtype=np.int32, count=len(positions))
+    # a larger x or y on the walk is further left or up on the map
+    x_offsets = -np.rint(xs * movement_pixels * scale).astype(np.int32)
+    y_offsets = -np.rint(ys * movement_pixels * scale).astype(np.int32)
+
+    # size of the big picture: tight around the outermost images, no blank margin
+    x_offsets -= x_offsets.min()
+    y_offsets -= y_offsets.min()
+    assembled_image_size_x = int(x_offsets.max()) + width
+    assembled_image_size_y = int(y_offsets.max()) + height
+
+    # place every cropped image row by row, top rows first so the strip writer can flush finished rows,
+    # and left to right within a row so consecutive copies land next to each other on the canvas
+    order = np.lexsort((x_offsets, y_offsets))
+    placements = list(zip(y_offsets[order].tolist(), x_offsets[order].tolist(), [images[i] for i in order]))
+
+    print(f"creating assembled image: {assembled_image_size_x}x{assembled_image_size_y} pixel png.")
+    output_filename = f"{output_base_filename}_steps{steps}_zoom{zoom_level}_{assembled_image_size_x}x{assembled_image_size_y}px.png"
+    write_map_in_strips(output_filename, placements, assembled_image_size_x, assembled_image_size_y, (width, height))
 
     # save the result
     print("___________________________________________")
-    width, height = assembled_image.size
-    output_filename = f"{output_base_filename}_steps{steps}_zoom{zoom_level}_{width}x{height}px.png"
-    assembled_image.save(output_filename)
     print(f"Assembled map saved as {output_filename}")
     file_stats = os.stat(output_filename)
     print(f'File size is {round(file_stats.st_size / (1024 * 1024), 2)} MegaBytes')
 
 
-def cleanup(driver, raw_dir, cropped_dir):
+def load_tile(filepath, tile_size):
+    """
+    Decode a cropped image into an RGB numpy array of the given size.
+
+    Images of a different size are downscaled with a box filter, the cheapest filter that
+    still averages every source pixel, which suits screenshots of raster map tiles.
+    The file is opened with a context manager, so only the image being placed is held open.
+
+    Parameters:
+    filepath (str): The path of the cropped image.
+    tile_size (tuple): The (width, height) the image is placed with on the assembled map.
+
+    Returns:
+    numpy.ndarray: The pixels of the image as a (height, width, 3) uint8 array.
+    """
+    with Image.open(filepath) as image:
+        # decode right away, so the file handle is released when leaving the block
+        image.load()
+        tile = image.convert('RGB')
+    if tile.size != tile_size:
+        tile = tile.resize(tile_size, Image.BOX)
+    return np.asarray(tile)
+
+
+def write_map_in_strips(output_filename, placements, image_size_x, image_size_y, tile_size):
+    """
+    Write the assembled map to a PNG file while holding only a strip of rows in memory.
+
+    The placements are sorted by their top row, so once a cropped image is placed at a row
+    no later image can touch the rows above it. Those rows are handed over to pypng right away
+    and the strip is shifted up, keeping the memory use at one strip of the height of a cropped
+    image instead of the whole canvas.
+
+    Parameters:
+    output_filename (str): The path of the PNG file to write.
+    placements (list): Sorted (y_offset, x_offset, filepath) tuples of the cropped images.
+    image_size_x (int): Width of the assembled image in pixels.
+    image_size_y (int): Height of the assembled image in pixels.
+    tile_size (tuple): The (width, height) of a cropped image on the assembled map.
+    """
+    strip_height = tile_size[1]
+    strip = np.full((strip_height, image_size_x, 3), 255, dtype=np.uint8)
+    strip_top = 0  # row of the assembled image held in the first row of the strip
+
+    def flush_rows(until_row):
+        nonlocal strip_top
+        while strip_top < until_row:
+            count = min(until_row - strip_top, strip_height)
+            for row in strip[:count]:
+                yield row.reshape(-1)
+            strip[:strip_height - count] = strip[count:]
+            strip[strip_height - count:] = 255
+            strip_top += count
+
+    def rows():
+        for y_offset, x_offset, img in placements:
+            yield from flush_rows(y_offset)
+            print(f"assembly with offset: x:{x_offset} y:{y_offset} on {img}")
+            tile = load_tile(img, tile_size)[:, :image_size_x - x_offset]
+            tile_height, tile_width = tile.shape[:2]
+            strip[:tile_height, x_offset:x_offset + tile_width] = tile
+        yield from flush_rows(image_size_y)
+
+    # written under a temporary name, so a failed assembly leaves no truncated map behind
+    partial_filename = output_filename + ".part"
+    try:
+        with open(partial_filename, 'wb', buffering=OUTPUT_BUFFER_SIZE) as output_file:
+            png.Writer(image_size_x, image_size_y, greyscale=False, compression=PNG_COMPRESS_LEVEL).write(output_file, rows())
+        os.replace(partial_filename, output_filename)
+    finally:
+        if os.path.exists(partial_filename):
+            os.remove(partial_filename)
+
+
+def report_pillow_build():
+    """
+    Print whether the SIMD build of Pillow is in use.
+
+    Pillow-SIMD is a drop-in replacement of Pillow with SSE4/AVX2 versions of crop, paste and
+    resize, see the README for installing it. Its version numbers carry a '.postN' suffix.
+
+    Returns:
+    bool: True if Pillow-SIMD is active.
+    """
+    simd = 'post' in PIL.__version__
+    if simd:
+        print(f"Pillow-SIMD {PIL.__version__} is active.")
+    else:
+        print(f"Pillow {PIL.__version__} is active, Pillow-SIMD would speed up cropping and assembly.")
+    return simd
+
+
+def cleanup(driver, cropped_dir):
     """
     Clean up resources and temporary files after the map capture process.
 
     This function performs the following cleanup tasks:
     1. Closes the Selenium WebDriver.
-    2. Removes all PNG files from the cropped images directory.
-    3. Removes all PNG files from the raw screenshots directory.
-    4. Attempts to remove the cropped and raw directories.
+    2. Removes the cropped images directory with all of its files.
 
     Parameters:
-    driver (selenium.webdriver.remote.webdriver.WebDriver): The Selenium WebDriver instance to be closed.
-    raw_dir (str): Path to the directory containing raw screenshots.
+    driver (selenium.webdriver.remote.webdriver.WebDriver): The Selenium WebDriver instance to be closed,
+        None if the tiles were downloaded without a browser.
     cropped_dir (str): Path to the directory containing cropped images.
 
     Side effects:
     - Closes the browser controlled by the WebDriver.
-    - Deletes files and attempts to remove directories.
+    - Deletes files and attempts to remove the directory.
     - Prints status messages to the console.
     """
     print("Cleaning up...")
-    driver.quit()
-    for filename in os.listdir(cropped_dir):
-        if filename.endswith(".png"):
-            os.remove(os.path.join(cropped_dir, filename))
-    for filename in os.listdir(raw_dir):
-        if filename.endswith(".png"):
-            os.remove(os.path.join(raw_dir, filename))
-    try:
-        os.rmdir(cropped_dir)
-        os.rmdir(raw_dir)
-    except OSError as e:
-         print(f"Failed to remove sub directories {cropped_dir} and/or {raw_dir} since {repr(e)}")
+    if driver is not None:
+        driver.quit()
+    shutil.rmtree(cropped_dir, ignore_errors=True)
+    if os.path.exists(cropped_dir):
+        print(f"Failed to remove sub directory {cropped_dir}")
     print("Process completed.")
 
 
@@ -527,30 +743,42 @@ def main():
 
     The function performs the following steps:
     1. Sets up parameters for map navigation and image processing.
-    2. Creates necessary directories for storing raw and processed images.
-    3. Opens a browser and navigates to the map.
-    4. Captures screenshots of the map, moving in a spiral pattern.
+    2. Creates necessary directories for storing processed images.
+    3. Opens a browser and navigates to the map, or downloads the tiles from the tile server.
+    4. Captures screenshots of the map, moving row by row.
     5. Processes and crops the captured screenshots.
     6. Assembles the cropped images into a large map.
     7. Cleans up resources.
     """
     title = "Pest Megye"  # Title for the assembled map image
     movement_pixels = 800  # Adjust drag distance of mouse
-    steps = 13  # number of "circles" we walk around the map centre
+    steps = 13  # number of movements along each side of the square walked around the map centre
     zoom_level = 13  # Adjust map zoom level upto 19
-    pan_wait_seconds = 6  # seconds, Wait for the map to load after each panning
-    base_dir, raw_dir, cropped_dir = create_directories(zoom_level, steps)
+    latitude, longitude = 47.496930, 19.050561  # centre of the map
+    use_tile_server = False  # download the tiles directly instead of screenshotting the browser
+    pan_wait_seconds = 6  # seconds, Wait at most this long for the map to load after each panning
+    scale = 1.0  # downscale factor of the assembled map, above 0 and at most 1.0, e.g. 0.5 for half the width and height
+    verbose = False  # print debugging information about every pan
+    base_dir, cropped_dir = create_directories(zoom_level, steps)
     dark_top, dark_bottom = 110, 110
     dark_left, dark_right = 400, 100
     dark = {'top': dark_top, 'bottom': dark_bottom, 'left': dark_left, 'right': dark_right}
     start_time = time.time()
     print(f"Movement is {movement_pixels}px, steps are {steps}, zoom level is {zoom_level}.")
+    report_pillow_build()
 
     # workflow starts here
-    driver = open_browser(zoom_level=zoom_level)
-    cropped_image_size = fetch_map(cropped_dir, dark, driver, movement_pixels, raw_dir, steps, pan_wait_seconds)
-    assemble_big_map(base_dir, cropped_dir, movement_pixels, steps, zoom_level, cropped_image_size, title)
-    cleanup(driver, raw_dir, cropped_dir)
+    if use_tile_server:
+        # roughly the same area the browser walk would cover
+        driver = None
+        tile_radius = (steps * movement_pixels) // (2 * TILE_SIZE) + 1
+        cropped_image_size = fetch_tiles(cropped_dir, zoom_level, latitude, longitude, tile_radius)
+        assemble_big_map(base_dir, cropped_dir, TILE_SIZE, tile_radius, zoom_level, cropped_image_size, title, scale)
+    else:
+        driver = open_browser(zoom_level=zoom_level, latitude=latitude, longitude=longitude)
+        cropped_image_size = fetch_map(cropped_dir, dark, driver, movement_pixels, steps, pan_wait_seconds, verbose)
+        assemble_big_map(base_dir, cropped_dir, movement_pixels, steps, zoom_level, cropped_image_size, title, scale)
+    cleanup(driver, cropped_dir)
 
     # script running time
     print(f"Total execution time was: {((time.time() - start_time) / 60):.2f} minutes.")